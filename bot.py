@@ -1,4 +1,3 @@
-import traceback
 import logging
 import asyncio
 import sys
@@ -8,7 +7,17 @@ from database_handler import DatabaseHandler
 from config_handler import ConfigHandler
 from helpers import logger_handlers, embed_handler
 from helpers.licence_helper import get_current_time
-from helpers.misc import maximize_size
+from helpers.misc import maximize_size, format_traceback
+from helpers.cache import LRUCache
+from cogs import COGS
+
+# uvloop is optional (not available on Windows), the event loop policy has to be
+# set before the loop is created in Bot.__init__ so the database setup runs on it too.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
@@ -17,46 +26,120 @@ root_logger.addHandler(logger_handlers.get_file_handler())
 logger = logging.getLogger("discord")
 logger.setLevel(logging.WARNING)
 
-startup_extensions = ["licenses",
-                      "bot_owner_commands",
-                      "guild",
-                      "bot_information",
-                      "help",
-                      "top_gg_api",
-                      "cmd_errors"]
+_PREFIX_CACHE_SIZE = 50_000
+_LOG_QUEUE_SIZE = 256
+_LOG_SEND_DELAY = 0.25
+# Exceptions from events that are expected and don't need traceback in log channel
+_IGNORED_EVENT_EXCEPTIONS = (discord.Forbidden,)
 
 
 class Bot(commands.Bot):
     def __init__(self, **kwargs):
         self.config = ConfigHandler("config")
+        self.default_prefix = self.config["default_prefix"]
+        self.developer_ids = frozenset(self.config["developers"].values())
         self.main_db = asyncio.get_event_loop().run_until_complete(DatabaseHandler.create_instance())
         self.up_time_start_time = get_current_time()
+        self.prefix_cache = LRUCache(maxsize=_PREFIX_CACHE_SIZE)
+        self._pending_prefix_fetches = set()
+        self._log_channel = None
         super(Bot, self).__init__(command_prefix=self.prefix_callable,
                                   help_command=None,
                                   description=self.config["bot_description"],
                                   case_insensitive=True, **kwargs)
+        self._log_queue = asyncio.Queue(maxsize=_LOG_QUEUE_SIZE)
+        self.loop.create_task(self._log_channel_worker())
 
-    async def prefix_callable(self, bot_client, message):
+    def load_extensions(self, extensions):
+        """
+        Loads all passed extensions from cogs directory.
+        Failure of one extension is logged and doesn't stop loading of others.
+
+        Loading is kept sequential since load_extension mutates bot state and has to run in
+        the event loop thread, any network/database work that cogs need is already scheduled
+        as tasks in their __init__ so it runs concurrently once the bot is started.
+        :param extensions: iterable of extension names (file names from cogs directory without suffix)
+        """
+        root_logger.info("Loaded extensions:")
+        for extension in extensions:
+            cog_path = f"cogs.{extension}"
+            try:
+                self.load_extension(cog_path)
+                root_logger.info(f"\t{cog_path}")
+            except Exception as e:
+                exc = f"{type(e).__name__}: {e}"
+                root_logger.error(f"{exc} Failed to load extension {cog_path}")
+                root_logger.warning(format_traceback(e))
+
+    def prefix_callable(self, bot_client, message):
+        """
+        Guild prefixes are cached in self.prefix_cache so we don't query the database for each message.
+        This is intentionally not a coroutine so cached prefixes are returned without scheduling anything.
+
+        On cache miss the default prefix is returned for that message and the guild prefix is fetched
+        in the background. Guilds whose prefix can't be fetched are cached as empty string so the failing
+        query is not repeated for every message, for those (and for DMs) the default prefix is used.
+        """
+        default_prefix = self.default_prefix
+        if message.guild is None:
+            return default_prefix
+
+        prefix_cache = self.prefix_cache
+        guild_id = message.guild.id
+        if guild_id in prefix_cache:
+            return prefix_cache[guild_id] or default_prefix
+
+        if guild_id not in self._pending_prefix_fetches:
+            self._pending_prefix_fetches.add(guild_id)
+            self.loop.create_task(self._fetch_guild_prefix(message.guild))
+        return default_prefix
+
+    async def get_guild_prefix(self, guild) -> str:
+        """
+        Returns guild prefix from cache, on cache miss it's fetched from the database (and cached).
+        """
+        if guild.id in self.prefix_cache:
+            prefix = self.prefix_cache[guild.id]
+        else:
+            prefix = await self._fetch_guild_prefix(guild)
+        return prefix or self.default_prefix
+
+    async def _fetch_guild_prefix(self, guild) -> str:
         try:
-            # TODO: Store this in list or something so we don't waste calls to db for each message
-            return await bot_client.main_db.get_guild_prefix(message.guild.id)
+            prefix = await self.main_db.get_guild_prefix(guild.id)
         except Exception as err:
-            """
-            If fetching prefix from database errors just use the default prefix.
-            This is also used in DMs where the guild is None
-            """
-            default_prefix = self.config["default_prefix"]
-            if message.guild is not None:
-                # Don't spam the log if it's DMs
-                # We only want to log it in case guild prefix is missing
-                root_logger.error(f"Can't get guild {message.guild} prefix. Error:{err}. "
-                                  f"Using '{default_prefix}' as prefix.")
-            return default_prefix
+            root_logger.error(f"Can't get guild {guild} prefix. Error:{err}. "
+                              f"Using '{self.default_prefix}' as prefix.")
+            prefix = ""
+        finally:
+            self._pending_prefix_fetches.discard(guild.id)
+
+        self.prefix_cache[guild.id] = prefix
+        return prefix
+
+    def reload_config(self):
+        """
+        Reloads json config and refreshes values that are cached from it.
+        """
+        self.config.reload_config()
+        self.default_prefix = self.config["default_prefix"]
+        self.developer_ids = frozenset(self.config["developers"].values())
+        if self.is_ready():
+            self._update_log_channel()
+
+    def _update_log_channel(self):
+        log_channel_id = self.config["developer_log_channel_id"]
+        self._log_channel = self.get_channel(log_channel_id)
+        if self._log_channel is None:
+            root_logger.warning(f"Log channel {log_channel_id} not found, errors will only be logged locally.")
 
     async def on_ready(self):
         root_logger.info(f"Logged in as: {self.user.name} - {self.user.id}"
                          f"\tDiscordPy version: {discord.__version__}")
         root_logger.info("Successfully logged in and booted...!")
+        self._update_log_channel()
+        # Warm up prefix cache with one query instead of querying on first message from each guild
+        self.prefix_cache.update(await self.main_db.get_all_guild_prefixes())
 
     @staticmethod
     async def on_connect():
@@ -78,43 +161,72 @@ class Bot(commands.Bot):
         Can only have one and it's gotta be in main file.
         """
         exc_info = sys.exc_info()
+        if exc_info[0] is not None and issubclass(exc_info[0], _IGNORED_EVENT_EXCEPTIONS):
+            # Example member has blocked DMs, nothing to fix so skip formatting and sending traceback
+            root_logger.warning(f"Ignoring {exc_info[0].__name__} in '{event}': {exc_info[1]}")
+            return
+
+        if self.get_log_channel() is None:
+            # Nowhere to send it, let the logger format the traceback
+            root_logger.critical(f"Uncaught exception in '{event}'", exc_info=exc_info)
+            return
+
         exc_type = exc_info[0].__name__ if exc_info[0] is not None else "<no exception>"
         exc_what = str(exc_info[1]) if exc_info[1] is not None else ""
-        log_message = f"Uncaught {exc_type} in '{event}': {exc_what}\n{traceback.format_exc()}"
+        traceback_message = format_traceback(exc_info[1]) if exc_info[1] is not None else ""
+        log_message = f"Uncaught {exc_type} in '{event}': {exc_what}\n{traceback_message}"
         await self.send_to_log_channel(log_message, title="on_error exception!")
 
+    def get_log_channel(self):
+        """
+        Log channel is looked up once in on_ready/reload_config and then reused.
+        :return: bot log channel or None if the bot is not ready or the channel is not found
+        """
+        if not self.is_ready():
+            return None
+        return self._log_channel
+
     async def send_to_log_channel(self, message: str, *, title: str, ctx=None):
         """
-        Logs passed message to logger as critical and sends the said message to bot log channel, if one is found.
+        Logs passed message to logger as critical and queues the said message to be sent to bot log channel,
+        if one is found. Sending is done by _log_channel_worker so the caller doesn't wait on Discord API.
+        If the queue is full (error spam) the message is only logged.
         :param message: Message with error/traceback
         :param title: Title for message
         :param ctx: optional, if passed will be used to add additional info to message embed footer
         """
         root_logger.critical(f"{title}\n{message}")
         if self.is_ready():
-            log_channel = self.get_channel(self.config["developer_log_channel_id"])
-            embed = embed_handler.simple_embed(maximize_size(message), title, discord.Colour.red())
-            if ctx is not None:
-                guild_id = "DM" if ctx.guild is None else ctx.guild.id
-                footer = f"Guild: {guild_id}    Author: {ctx.author}    Channel: {ctx.channel.id}"
-                embed.set_footer(text=footer)
+            try:
+                self._log_queue.put_nowait((message, title, ctx))
+            except asyncio.QueueFull:
+                root_logger.warning("Log channel queue is full, message not sent to log channel.")
+
+    async def _log_channel_worker(self):
+        """
+        Sends queued log messages to bot log channel one by one.
+        Embeds are constructed here and only if the log channel is found, so callers
+        that log errors don't pay for embed construction.
+        Failure to send one message is logged and doesn't stop the worker.
+        """
+        while True:
+            message, title, ctx = await self._log_queue.get()
+            log_channel = self.get_log_channel()
             if log_channel is not None:
-                await log_channel.send(embed=embed)
+                embed = embed_handler.simple_embed(maximize_size(message), title, discord.Colour.red())
+                if ctx is not None:
+                    guild_id = "DM" if ctx.guild is None else ctx.guild.id
+                    footer = f"Guild: {guild_id}    Author: {ctx.author}    Channel: {ctx.channel.id}"
+                    embed.set_footer(text=footer)
+                try:
+                    await log_channel.send(embed=embed)
+                except Exception as e:
+                    root_logger.warning(f"Can't send to log channel: {e}")
+            # Small delay between sends so error spam doesn't hit rate limits
+            await asyncio.sleep(_LOG_SEND_DELAY)
 
 
 if __name__ == "__main__":
     bot = Bot()
-    root_logger.info("Loaded extensions:")
-    for extension in startup_extensions:
-        cog_path = f"cogs.{extension}"
-        try:
-            bot.load_extension(cog_path)
-            root_logger.info(f"\t{cog_path}")
-        except Exception as e:
-            exc = f"{type(e).__name__}: {e}"
-            root_logger.error(f"{exc} Failed to load extension {cog_path}")
-            traceback_msg = traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-            root_logger.warning(traceback_msg)
-
+    bot.load_extensions(COGS)
     bot.run(bot.config["token"])
-
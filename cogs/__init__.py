@@ -0,0 +1,10 @@
+# Extensions loaded on startup, in load order.
+# Resolved statically so startup doesn't depend on scanning the cogs directory.
+# Cogs not listed here (example games) are disabled and can be loaded manually with the load command.
+COGS = ("licenses",
+        "bot_owner_commands",
+        "guild",
+        "bot_information",
+        "help",
+        "top_gg_api",
+        "cmd_errors")
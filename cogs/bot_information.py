@@ -3,6 +3,8 @@ import time
 import psutil
 import logging
 import discord
+from itertools import cycle
+from collections import namedtuple
 from discord.ext import commands, tasks
 from helpers.misc import construct_load_bar_string, construct_embed, time_ago, embed_space
 from helpers.licence_helper import get_current_time
@@ -10,6 +12,21 @@ from helpers.embed_handler import info
 
 logger = logging.getLogger(__name__)
 
+SystemStats = namedtuple("SystemStats", ["bot_ram_usage", "bot_memory_percent", "bot_cpu_usage",
+                                         "io_read_bytes", "io_write_bytes", "server_ram_usage",
+                                         "server_memory_percent", "server_cpu_usage", "cpu_count"])
+_SYSTEM_STATS_TTL = 3.0
+# Permissions for invite link: manage_roles, read_messages, send_messages and manage_messages
+_BOT_PERMISSIONS_VALUE = 268446720
+# The weird numbers is just guessing number of spaces so the lines align
+# Needed since embeds are not monospaced font
+_SERVER_INFO_TEMPLATE = (f"**Bot RAM usage:**{embed_space*7}{{bot_ram}}\n"
+                         f"**Server RAM usage:**{embed_space}{{server_ram}}\n"
+                         f"**Bot CPU usage:**{embed_space*9}{{bot_cpu}}\n"
+                         f"**Server CPU usage:**{embed_space*3}{{server_cpu}}\n"
+                         f"**IO (r/w):** {{io_read}} / {{io_write}}\n"
+                         f"\n**Links:\n**{{footer}}")
+
 
 class BotInformation(commands.Cog):
     def __init__(self, bot):
@@ -18,21 +35,31 @@ class BotInformation(commands.Cog):
         # Fetch developers only once, at start
         self.bot.loop.create_task(self._set_developers())
         self.process = psutil.Process(os.getpid())
-        self.activity = 0
+        # First cpu_percent call without interval always returns 0.0, it only sets the starting point.
+        # Priming them here means calls in about return usage since the last call without blocking.
+        self.process.cpu_percent(None)
+        psutil.cpu_percent(None)
+        self._system_stats_cache = (0.0, None)
+        # Activities are constructed when used since some of them show current data
+        self._activities = cycle((self._roles_activity, self._guild_count_activity))
         self.activity_loop.start()
         self.patreon_link = "https://www.patreon.com/Licensy"
         self.github_source = "https://github.com/albertopoljak/Licensy"
         self.top_gg_vote_link = "https://discordbots.org/bot/604057722878689324"
+        self._invite_link = None
 
     @tasks.loop(seconds=300.0)
     async def activity_loop(self):
-        if self.activity == 0:
-            await self.bot.change_presence(activity=discord.Game(name="Roles!"))
-            self.activity = 1
-        elif self.activity == 1:
-            msg = f"{len(self.bot.guilds)} guilds!"
-            await self.bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=msg))
-            self.activity = 0
+        activity = next(self._activities)()
+        await self.bot.change_presence(activity=activity)
+
+    @staticmethod
+    def _roles_activity():
+        return discord.Game(name="Roles!")
+
+    def _guild_count_activity(self):
+        msg = f"{len(self.bot.guilds)} guilds!"
+        return discord.Activity(type=discord.ActivityType.watching, name=msg)
 
     @activity_loop.before_loop
     async def before_activity_loop(self):
@@ -43,15 +70,18 @@ class BotInformation(commands.Cog):
     @commands.Cog.listener()
     async def on_message(self, message):
         # If bot is mentioned in message (both in guild and DM) show it's prefix
-        if message.mentions and not message.author.bot and self.bot.user in message.mentions:
-            if message.guild is None:
-                prefix = self.bot.config["default_prefix"]
-                msg = f"My prefix here is **{prefix}**"
-                await message.channel.send(embed=info(msg, None))
-            else:
-                prefix = await self.bot.main_db.get_guild_prefix(message.guild.id)
-                msg = f"My prefix in this guild is **{prefix}**"
-                await message.channel.send(embed=info(msg, message.guild.me))
+        # Called for every message so cheapest checks go first
+        if message.author.bot or not message.mentions or self.bot.user not in message.mentions:
+            return
+
+        if message.guild is None:
+            prefix = self.bot.default_prefix
+            msg = f"My prefix here is **{prefix}**"
+            await message.channel.send(embed=info(msg, None))
+        else:
+            prefix = await self.bot.get_guild_prefix(message.guild)
+            msg = f"My prefix in this guild is **{prefix}**"
+            await message.channel.send(embed=info(msg, message.guild.me))
 
     @commands.command()
     async def ping(self, ctx):
@@ -62,10 +92,10 @@ class BotInformation(commands.Cog):
         Second value is Discord Gateway latency.
 
         """
-        before = time.monotonic()
+        before = time.perf_counter()
         message = await ctx.send(embed=info("Pong", ctx.me))
-        ping = (time.monotonic() - before) * 1000
-        content = (f":ping_pong:   |   {int(ping)}ms\n"
+        ping = (time.perf_counter() - before) * 1000
+        content = (f":ping_pong:   |   {ping:.0f}ms\n"
                    f":timer:   |   {self.bot.latency * 1000:.0f}ms")
         await message.edit(embed=info(content, ctx.me, title="Results:"))
 
@@ -87,9 +117,25 @@ class BotInformation(commands.Cog):
         await ctx.send(embed=info(self.patreon_link, ctx.me, title="Thank you :)"))
 
     def _get_bot_invite_link(self):
-        perms = discord.Permissions()
-        perms.update(manage_roles=True, read_messages=True, send_messages=True, manage_messages=True)
-        return discord.utils.oauth_url(self.bot.user.id, permissions=perms)
+        """
+        Invite link doesn't change so it's constructed only once.
+        Can only be called once the bot is logged in since it needs bot user id.
+        """
+        if self._invite_link is None:
+            perms = discord.Permissions(_BOT_PERMISSIONS_VALUE)
+            self._invite_link = discord.utils.oauth_url(self.bot.user.id, permissions=perms)
+        return self._invite_link
+
+    def _get_links_footer(self):
+        """
+        Links shown at the end of about command.
+        Support server link is read from config each time so it follows config reloads.
+        """
+        return (f"[Invite]({self._get_bot_invite_link()})"
+                f" | [Donate]({self.patreon_link})"
+                f" | [Support server]({self.bot.config['support_channel_invite']})"
+                f" | [Vote]({self.top_gg_vote_link})"
+                f" | [Github]({self.github_source})")
 
     @commands.command()
     async def support_server(self, ctx):
@@ -129,59 +175,53 @@ class BotInformation(commands.Cog):
         Show bot information (stats/links/etc).
 
         """
-        avg_members = round(len(self.bot.users) / len(self.bot.guilds))
-        avg_members_string = f"{avg_members} users/server"
+        # Summing member counts is O(guilds) while len(bot.users) has to go through the whole user cache.
+        # Note that members that are in multiple guilds are counted multiple times.
+        guilds = self.bot.guilds
+        guild_count = len(guilds)
+        total_members = sum(guild.member_count or 0 for guild in guilds)
+        avg_members = round(total_members / guild_count)
+        avg_members_string = f"{avg_members} members/server"
 
-        active_licenses = await self.bot.main_db.get_licensed_roles_total_count()
-        stored_licenses = await self.bot.main_db.get_stored_license_total_count()
+        active_licenses, stored_licenses = await self.bot.main_db.get_license_counts()
 
-        bot_ram_usage = self.process.memory_full_info().rss / 1024 ** 2
-        bot_ram_usage = f"{bot_ram_usage:.2f} MB"
-        bot_ram_usage_field = construct_load_bar_string(self.process.memory_percent(), bot_ram_usage)
+        system_stats = await self._get_system_stats()
 
-        virtual_memory = psutil.virtual_memory()
-        server_ram_usage = f"{virtual_memory.used/1024/1024:.0f} MB"
-        server_ram_usage_field = construct_load_bar_string(virtual_memory.percent, server_ram_usage)
+        bot_ram_usage = f"{system_stats.bot_ram_usage / 1024 ** 2:.2f} MB"
+        bot_ram_usage_field = construct_load_bar_string(system_stats.bot_memory_percent, bot_ram_usage)
 
-        cpu_count = psutil.cpu_count()
+        server_ram_usage = f"{system_stats.server_ram_usage/1024/1024:.0f} MB"
+        server_ram_usage_field = construct_load_bar_string(system_stats.server_memory_percent, server_ram_usage)
 
-        bot_cpu_usage = self.process.cpu_percent()
+        bot_cpu_usage = system_stats.bot_cpu_usage
         if bot_cpu_usage > 100:
-            bot_cpu_usage = bot_cpu_usage / cpu_count
+            bot_cpu_usage = bot_cpu_usage / system_stats.cpu_count
         bot_cpu_usage_field = construct_load_bar_string(bot_cpu_usage)
 
-        server_cpu_usage = psutil.cpu_percent()
+        server_cpu_usage = system_stats.server_cpu_usage
         if server_cpu_usage > 100:
-            server_cpu_usage = server_cpu_usage / cpu_count
+            server_cpu_usage = server_cpu_usage / system_stats.cpu_count
         server_cpu_usage_field = construct_load_bar_string(server_cpu_usage)
 
-        io_counters = self.process.io_counters()
-        io_read_bytes = f"{io_counters.read_bytes/1024/1024:.3f}MB"
-        io_write_bytes = f"{io_counters.write_bytes/1024/1024:.3f}MB"
-
-        footer = (f"[Invite]({self._get_bot_invite_link()})"
-                  f" | [Donate]({self.patreon_link})"
-                  f" | [Support server]({self.bot.config['support_channel_invite']})"
-                  f" | [Vote]({self.top_gg_vote_link})"
-                  f" | [Github]({self.github_source})")
-
-        # The weird numbers is just guessing number of spaces so the lines align
-        # Needed since embeds are not monospaced font
-        field_content = (f"**Bot RAM usage:**{embed_space*7}{bot_ram_usage_field}\n"
-                         f"**Server RAM usage:**{embed_space}{server_ram_usage_field}\n"
-                         f"**Bot CPU usage:**{embed_space*9}{bot_cpu_usage_field}\n"
-                         f"**Server CPU usage:**{embed_space*3}{server_cpu_usage_field}\n"
-                         f"**IO (r/w):** {io_read_bytes} / {io_write_bytes}\n"
-                         f"\n**Links:\n**" + footer)
+        io_read_bytes = f"{system_stats.io_read_bytes/1024/1024:.3f}MB"
+        io_write_bytes = f"{system_stats.io_write_bytes/1024/1024:.3f}MB"
+
+        field_content = _SERVER_INFO_TEMPLATE.format(bot_ram=bot_ram_usage_field,
+                                                     server_ram=server_ram_usage_field,
+                                                     bot_cpu=bot_cpu_usage_field,
+                                                     server_cpu=server_cpu_usage_field,
+                                                     io_read=io_read_bytes,
+                                                     io_write=io_write_bytes,
+                                                     footer=self._get_links_footer())
 
         # If called immediately after startup it will fail since developers are not yet loaded
         developers = self.developers if self.developers else ["loading.."]
         fields = {"Last boot": self.last_boot(),
                   "Developers": "\n".join(developers),
                   "Library": "discord.py",
-                  "Servers": len(self.bot.guilds),
-                  "Average users:": avg_members_string,
-                  "Total users": len(self.bot.users),
+                  "Servers": guild_count,
+                  "Average members:": avg_members_string,
+                  "Total members": total_members,
                   "Commands": len(self.bot.commands),
                   "Active licenses:": active_licenses,
                   "Stored licenses:": stored_licenses,
@@ -191,6 +231,42 @@ class BotInformation(commands.Cog):
         embed = construct_embed(ctx.me, **fields)
         await ctx.send(embed=embed)
 
+    async def _get_system_stats(self) -> SystemStats:
+        """
+        Returns system stats, reusing the last result if it's younger than _SYSTEM_STATS_TTL seconds
+        so bursts of about calls (from multiple guilds) don't re-read /proc each time.
+        """
+        cached_time, cached_stats = self._system_stats_cache
+        if cached_stats is not None and time.monotonic() - cached_time < _SYSTEM_STATS_TTL:
+            return cached_stats
+
+        system_stats = await self.bot.loop.run_in_executor(None, self._collect_system_stats)
+        self._system_stats_cache = (time.monotonic(), system_stats)
+        return system_stats
+
+    def _collect_system_stats(self) -> SystemStats:
+        """
+        Reads bot process and server stats.
+        All of these read /proc files so this is blocking, call it in executor.
+        Process info is read in one go inside oneshot instead of for each call separately.
+        """
+        with self.process.oneshot():
+            bot_ram_usage = self.process.memory_full_info().rss
+            bot_memory_percent = self.process.memory_percent()
+            bot_cpu_usage = self.process.cpu_percent()
+            io_counters = self.process.io_counters()
+
+        virtual_memory = psutil.virtual_memory()
+        return SystemStats(bot_ram_usage=bot_ram_usage,
+                           bot_memory_percent=bot_memory_percent,
+                           bot_cpu_usage=bot_cpu_usage,
+                           io_read_bytes=io_counters.read_bytes,
+                           io_write_bytes=io_counters.write_bytes,
+                           server_ram_usage=virtual_memory.used,
+                           server_memory_percent=virtual_memory.percent,
+                           server_cpu_usage=psutil.cpu_percent(),
+                           cpu_count=psutil.cpu_count())
+
     async def _set_developers(self):
         """
         Sets self.developers as a list of user mentions.
@@ -118,7 +118,7 @@ class BotOwnerCommands(commands.Cog):
         Reloads json config.
 
         """
-        self.bot.config.reload_config()
+        self.bot.reload_config()
         msg = "Successfully reloaded config."
         logger.info(msg)
         await ctx.send(embed=success(msg, ctx.me))
@@ -154,9 +154,9 @@ class BotOwnerCommands(commands.Cog):
     @commands.command(hidden=True)
     @commands.is_owner()
     async def guilds_diagnostic(self, ctx):
-        loaded_guilds = tuple(guild.id for guild in self.bot.guilds)
+        loaded_guilds = {guild.id for guild in self.bot.guilds}
         db_guilds = await self.bot.main_db.get_all_guild_ids()
-        difference = set(loaded_guilds).symmetric_difference(set(db_guilds))
+        difference = loaded_guilds.symmetric_difference(db_guilds)
         difference = None if len(difference) == 0 else difference
         message = (f"Loaded guilds: {len(loaded_guilds)}\n"
                    f"Database guilds: {len(db_guilds)}\n"
@@ -1,18 +1,63 @@
 import math
 import logging
-import traceback
 from asyncio import TimeoutError
 from discord.ext import commands
 from discord.errors import Forbidden
 from helpers.errors import RoleNotFound, DefaultGuildRoleNotSet, DatabaseMissingData
 from helpers.embed_handler import failure
+from helpers.misc import format_traceback
 
 logger = logging.getLogger(__name__)
 
 
+# Additional hints for Forbidden errors, by Discord error code
+_FORBIDDEN_HINTS = {
+    # 403 FORBIDDEN (error code: 50013): Missing Permissions
+    50013: "Check role hierarchy - I can only manage roles below me.",
+    # 403 FORBIDDEN (error code: 50007): Cannot send messages to this user.
+    50007: "Hint: Disabled DMs?"
+}
+
+
 class CmdErrors(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Maps error type to it's handler.
+        # Subclasses are handled by the handler of their closest parent, see _get_error_handler
+        self._error_handlers = {
+            commands.CommandNotFound: self._command_not_found,
+            commands.BotMissingPermissions: self._bot_missing_permissions,
+            commands.DisabledCommand: self._disabled_command,
+            commands.CommandOnCooldown: self._command_on_cooldown,
+            commands.MissingPermissions: self._missing_permissions,
+            commands.UserInputError: self._user_input_error,
+            commands.NoPrivateMessage: self._no_private_message,
+            commands.CheckFailure: self._check_failure,
+            Forbidden: self._forbidden,
+            RoleNotFound: self._role_not_found,
+            DefaultGuildRoleNotSet: self._default_guild_role_not_set,
+            DatabaseMissingData: self._database_missing_data,
+            TimeoutError: self._timeout_error
+        }
+        # Cache of resolved handlers for exact error types
+        self._resolved_handlers = {}
+
+    def _get_error_handler(self, error_type: type):
+        """
+        Returns handler for passed error type or None if there is no handler for it.
+        Handler is found by walking the type MRO so subclasses use the handler of their
+        closest registered parent, result is cached per type.
+        """
+        try:
+            return self._resolved_handlers[error_type]
+        except KeyError:
+            handler = None
+            for cls in error_type.__mro__:
+                if cls in self._error_handlers:
+                    handler = self._error_handlers[cls]
+                    break
+            self._resolved_handlers[error_type] = handler
+            return handler
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
@@ -23,123 +68,116 @@ class CmdErrors(commands.Cog):
         # Get the original exception
         error = getattr(error, "original", error)
 
-        if isinstance(error, commands.CommandNotFound):
-            try:
-                await ctx.send(embed=failure("Command not found."))
-            except Forbidden:
-                return
-            return
-
-        if isinstance(error, commands.BotMissingPermissions):
-            """
-            Note that this is only for checks of the command , specifically for bot_has_permissions 
-            example @commands.bot_has_permissions(administrator=True)
-            It will not work for example if in code role.edit is called but bot doesn't have manage role permission.
-            In that case a simple "Forbidden" will be raised.
-            """
-            missing = [perm.replace("_", " ").replace("guild", "server").title() for perm in error.missing_perms]
-            if len(missing) > 2:
-                fmt = "{}, and {}".format("**, **".join(missing[:-1]), missing[-1])
-            else:
-                fmt = " and ".join(missing)
-            _message = f"I need the **{fmt}** permission(s) to run this command."
-            await ctx.send(embed=failure(_message))
-            return
-
-        if isinstance(error, commands.DisabledCommand):
-            await ctx.send(embed=failure("This command has been disabled."))
+        handler = self._get_error_handler(type(error))
+        if handler is not None:
+            await handler(ctx, error)
             return
 
-        if isinstance(error, commands.CommandOnCooldown):
-            # Cooldowns are ignored for developers
-            if not await self.developer_bypass(ctx):
-                msg = f"This command is on cooldown, please retry in {math.ceil(error.retry_after)}s."
-                await ctx.send(embed=failure(msg))
-            return
-
-        if isinstance(error, commands.MissingPermissions):
-            """
-            Note that this is only for checks of the command , example @commands.has_permissions(administrator=True)
-            MissingPermissions is raised if check for permissions of the member who invoked the command has failed.
-            """
-            # Developers can bypass guild permissions
-            if not await self.developer_bypass(ctx):
-                missing = [perm.replace("_", " ").replace("guild", "server").title() for perm in error.missing_perms]
-                if len(missing) > 2:
-                    fmt = "{}, and {}".format("**, **".join(missing[:-1]), missing[-1])
-                else:
-                    fmt = " and ".join(missing)
-                _message = f"You need the **{fmt}** permission(s) to use this command."
-                await ctx.send(embed=failure(_message))
-            return
+        await self.log_traceback(ctx, error)
+        msg = (f"Ignoring exception **{error.__class__.__name__}** that happened while processing command "
+               f"**{ctx.command}**:\n{error}")
+        await ctx.send(embed=failure(msg))
 
-        if isinstance(error, commands.UserInputError):
-            await ctx.send(embed=failure(f"Invalid command input: {error}"))
+    @staticmethod
+    async def _command_not_found(ctx, error):
+        try:
+            await ctx.send(embed=failure("Command not found."))
+        except Forbidden:
             return
 
-        if isinstance(error, commands.NoPrivateMessage):
-            try:
-                await ctx.author.send(embed=failure("This command cannot be used in direct messages."))
-            except Forbidden:
-                pass
-            return
+    @staticmethod
+    async def _bot_missing_permissions(ctx, error):
+        """
+        Note that this is only for checks of the command , specifically for bot_has_permissions
+        example @commands.bot_has_permissions(administrator=True)
+        It will not work for example if in code role.edit is called but bot doesn't have manage role permission.
+        In that case a simple "Forbidden" will be raised.
+        """
+        missing = [perm.replace("_", " ").replace("guild", "server").title() for perm in error.missing_perms]
+        if len(missing) > 2:
+            fmt = "{}, and {}".format("**, **".join(missing[:-1]), missing[-1])
+        else:
+            fmt = " and ".join(missing)
+        _message = f"I need the **{fmt}** permission(s) to run this command."
+        await ctx.send(embed=failure(_message))
 
-        if isinstance(error, commands.CheckFailure):
-            await ctx.send(embed=failure("You do not have permission to use this command."))
-            return
+    @staticmethod
+    async def _disabled_command(ctx, error):
+        await ctx.send(embed=failure("This command has been disabled."))
 
-        if isinstance(error, Forbidden):
-            # 403 FORBIDDEN (error code: 50013): Missing Permissions
-            if error.code == 50013:
-                msg = (f"{error}.\n"
-                       f"Check role hierarchy - I can only manage roles below me.")
-                try:
-                    await ctx.send(embed=failure(msg))
-                except Forbidden:
-                    # Forbidden can also mean no permissions to send to that channel
-                    # Ignore so we don't get useless errors
-                    return
-
-            # 403 FORBIDDEN (error code: 50007): Cannot send messages to this user.
-            elif error.code == 50007:
-                msg = (f"{error}.\n"
-                       f"Hint: Disabled DMs?")
-                await ctx.send(embed=failure(msg))
+    async def _command_on_cooldown(self, ctx, error):
+        # Cooldowns are ignored for developers
+        if not await self.developer_bypass(ctx):
+            msg = f"This command is on cooldown, please retry in {math.ceil(error.retry_after)}s."
+            await ctx.send(embed=failure(msg))
 
+    async def _missing_permissions(self, ctx, error):
+        """
+        Note that this is only for checks of the command , example @commands.has_permissions(administrator=True)
+        MissingPermissions is raised if check for permissions of the member who invoked the command has failed.
+        """
+        # Developers can bypass guild permissions
+        if not await self.developer_bypass(ctx):
+            missing = [perm.replace("_", " ").replace("guild", "server").title() for perm in error.missing_perms]
+            if len(missing) > 2:
+                fmt = "{}, and {}".format("**, **".join(missing[:-1]), missing[-1])
             else:
-                try:
-                    # In case we got Forbidden because we can't send to the destination
-                    await ctx.send(embed=failure(f"{error}."))
-                except Forbidden:
-                    return
-            return
-
-        if isinstance(error, RoleNotFound):
-            await ctx.send(embed=failure(error.message))
-            return
+                fmt = " and ".join(missing)
+            _message = f"You need the **{fmt}** permission(s) to use this command."
+            await ctx.send(embed=failure(_message))
 
-        if isinstance(error, DefaultGuildRoleNotSet):
-            new_msg = error.message.replace("{prefix}", ctx.prefix)
-            await ctx.send(embed=failure(f"Trying to use default guild license but: {new_msg}"))
+    @staticmethod
+    async def _user_input_error(ctx, error):
+        await ctx.send(embed=failure(f"Invalid command input: {error}"))
+
+    @staticmethod
+    async def _no_private_message(ctx, error):
+        try:
+            await ctx.author.send(embed=failure("This command cannot be used in direct messages."))
+        except Forbidden:
+            pass
+
+    @staticmethod
+    async def _check_failure(ctx, error):
+        await ctx.send(embed=failure("You do not have permission to use this command."))
+
+    @staticmethod
+    async def _forbidden(ctx, error):
+        hint = _FORBIDDEN_HINTS.get(error.code)
+        msg = f"{error}.\n{hint}" if hint is not None else f"{error}."
+        try:
+            await ctx.send(embed=failure(msg))
+        except Forbidden:
+            # Forbidden can also mean no permissions to send to that channel
+            # Ignore so we don't get useless errors
             return
 
-        if isinstance(error, DatabaseMissingData):
-            await ctx.send(embed=failure(f"Database error: {error.message}"))
-            await self.log_traceback(ctx, error)
-            return
+    @staticmethod
+    async def _role_not_found(ctx, error):
+        await ctx.send(embed=failure(error.message))
 
-        if isinstance(error, TimeoutError):
-            await ctx.send(embed=failure("You took too long to reply."), delete_after=5)
-            return
+    @staticmethod
+    async def _default_guild_role_not_set(ctx, error):
+        new_msg = error.message.replace("{prefix}", ctx.prefix)
+        await ctx.send(embed=failure(f"Trying to use default guild license but: {new_msg}"))
 
+    async def _database_missing_data(self, ctx, error):
+        await ctx.send(embed=failure(f"Database error: {error.message}"))
         await self.log_traceback(ctx, error)
-        msg = (f"Ignoring exception **{error.__class__.__name__}** that happened while processing command "
-               f"**{ctx.command}**:\n{error}")
-        await ctx.send(embed=failure(msg))
+
+    @staticmethod
+    async def _timeout_error(ctx, error):
+        await ctx.send(embed=failure("You took too long to reply."), delete_after=5)
 
     async def log_traceback(self, ctx, error):
         error_type = type(error)
-        traceback_message = traceback.format_exception(etype=error_type, value=error, tb=error.__traceback__)
+        if self.bot.get_log_channel() is None:
+            # Nowhere to send it, let the logger format the traceback
+            logger.critical(f"Ignoring {error_type} exception in command '{ctx.command}':{error}",
+                            exc_info=(error_type, error, error.__traceback__))
+            return
+
+        traceback_message = format_traceback(error)
         log_message = f"Ignoring {error_type} exception in command '{ctx.command}':{error}\n{traceback_message}"
         await self.bot.send_to_log_channel(log_message, title="Command error!", ctx=ctx)
 
@@ -151,7 +189,7 @@ class CmdErrors(commands.Cog):
         :return: Bool if developer or not.
         """
         # Developers can bypass guild permissions
-        if ctx.message.author.id in self.bot.config["developers"].values():
+        if ctx.message.author.id in self.bot.developer_ids:
             # reinvoke() bypasses error handlers so we surround it with try/catch and just
             # send errors to ctx
             try:
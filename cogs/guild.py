@@ -1,12 +1,15 @@
 import logging
+import asyncio
 import discord
-from aiosqlite import IntegrityError
 from discord.ext import commands
 from helpers.embed_handler import success, failure
 from helpers.converters import license_duration
 
 logger = logging.getLogger(__name__)
 
+# Same as the PREFIX column constraint in GUILDS table
+_MAX_PREFIX_LENGTH = 5
+
 
 class Guild(commands.Cog):
     def __init__(self, bot):
@@ -14,15 +17,22 @@ class Guild(commands.Cog):
         self.bot.loop.create_task(self.startup_guild_database_check())
 
     async def startup_guild_database_check(self):
-        db_guilds_ids = await self.bot.main_db.get_all_guild_ids()
         logger.info("Starting database guild checkup..")
-        await self.bot.wait_until_ready()
-        # Checks for new guilds
-        for guild in self.bot.guilds:
-            if guild.id not in db_guilds_ids:
-                logger.info(f"Guild {guild.id} {guild} found but not registered. "
-                            f"Adding entry to database.")
-                await self.bot.main_db.setup_new_guild(guild.id, self.bot.config["default_prefix"])
+        # Query runs while the bot is still connecting instead of after it's ready.
+        # Ids are returned as frozenset so checking each loaded guild is O(1)
+        db_guilds_ids, _ = await asyncio.gather(self.bot.main_db.get_all_guild_ids(),
+                                                self.bot.wait_until_ready())
+        # Checks for new guilds, usually there are none so set difference is used instead of checking one by one
+        missing_guild_ids = {guild.id for guild in self.bot.guilds} - db_guilds_ids
+
+        if missing_guild_ids:
+            logger.info(f"Found {len(missing_guild_ids)} guilds that are not registered. "
+                        f"Adding entries to database.")
+            default_prefix = self.bot.default_prefix
+            # All missing guilds are inserted at once instead of a query for each
+            await self.bot.main_db.setup_new_guilds(missing_guild_ids, default_prefix)
+            for guild_id in missing_guild_ids:
+                self.bot.prefix_cache[guild_id] = default_prefix
 
         # Do not code the other way around
         # aka deleting database data if the guild in database doesn't exist in bot guilds
@@ -42,13 +52,13 @@ class Guild(commands.Cog):
         if ctx.prefix == prefix:
             await ctx.send(embed=failure(f"Already using prefix **{prefix}**"))
             return
-
-        try:
-            await self.bot.main_db.change_guild_prefix(ctx.guild.id, prefix)
-        except IntegrityError:
-            await ctx.send(embed=failure("Prefix is too long! Maximum of 5 characters please."))
+        elif len(prefix) > _MAX_PREFIX_LENGTH:
+            await ctx.send(embed=failure(f"Prefix is too long! Maximum of {_MAX_PREFIX_LENGTH} characters please."))
             return
 
+        guild_id = ctx.guild.id
+        await self.bot.main_db.change_guild_prefix(guild_id, prefix)
+        self.bot.prefix_cache[guild_id] = prefix
         await ctx.send(embed=success(f"Successfully changed prefix to **{prefix}**", ctx.me))
 
     @commands.command()
@@ -105,13 +115,15 @@ class Guild(commands.Cog):
         Shows database data for the guild.
 
         """
-        prefix, role_id, expiration = await self.bot.main_db.get_guild_info(ctx.guild.id)
-        stored_license_count = await self.bot.main_db.get_guild_license_total_count(ctx.guild.id)
-        active_license_count = await self.bot.main_db.get_guild_licensed_roles_total_count(ctx.guild.id)
+        guild = ctx.guild
+        main_db = self.bot.main_db
+        prefix, role_id, expiration = await main_db.get_guild_info(guild.id)
+        stored_license_count = await main_db.get_guild_license_total_count(guild.id)
+        active_license_count = await main_db.get_guild_licensed_roles_total_count(guild.id)
 
         # If the bot just joined the guild it can happen that the default license role is not set.
         if role_id is not None:
-            default_license_role = discord.utils.get(ctx.guild.roles, id=int(role_id))
+            default_license_role = guild.get_role(int(role_id))
             # In case it is set in db but was deleted from the guild.
             # This is needed in case the bot was offline and role was deleted
             # because on_guild_role_delete will not fire (we delete it from db in that event if that deleted role
@@ -119,7 +131,7 @@ class Guild(commands.Cog):
             # TODO: ABOVE EVENT
             if default_license_role is None:
                 default_license_role = role_id
-                log = f"Can't find default license role {role_id} from guild {ctx.guild.name},{ctx.guild.id}"
+                log = f"Can't find default license role {role_id} from guild {guild.name},{guild.id}"
                 msg = (f"Can't find default role {role_id} in this guild!\n"
                        f"It's saved in the database but it looks like it was deleted from the guild.\n"
                        f"Please update it.")
@@ -23,8 +23,7 @@ class PrettyHelpCommand(commands.MinimalHelpCommand):
     """
 
     def get_ending_note(self):
-        command_name = self.invoked_with
-        return "Type {0}{1} <command> for more info on a command.\n".format(self.clean_prefix, command_name)
+        return f"Type {self.clean_prefix}{self.invoked_with} <command> for more info on a command.\n"
 
     def get_opening_note(self):
         prefix = "If you like the bot please consider donating or starring the Github repository, ty :)"
@@ -37,16 +36,17 @@ class PrettyHelpCommand(commands.MinimalHelpCommand):
     def add_bot_commands_formatting(self, commands, heading):
         if commands:
             max_length = 19
-            outputs = [f"`  {c.name}{embed_space * (max_length - len(c.name))}{c.short_doc}`" for c in commands]
-            joined = "\n".join(outputs)
-            self.paginator.add_line(f"\n**__{heading}__**")
-            self.paginator.add_line(joined)
+            joined = "\n".join(f"`  {c.name}{embed_space * (max_length - len(c.name))}{c.short_doc}`"
+                                for c in commands)
+            # Heading and commands added as one paginator entry so the heading stays on the same page
+            self.paginator.add_line(f"\n**__{heading}__**\n{joined}")
 
     async def send_pages(self):
         destination = self.get_destination()
+        # Same for all pages
+        color = get_top_role_color(self.context.me)
         for page in self.paginator.pages:
-            embed = discord.Embed(description=page, color=get_top_role_color(self.context.me))
-            await destination.send(embed=embed)
+            await destination.send(embed=discord.Embed(description=page, color=color))
 
     async def send_bot_help(self, mapping):
         ctx = self.context
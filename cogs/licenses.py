@@ -1,8 +1,7 @@
 import logging
-from datetime import datetime
-from dateutil import parser
+import asyncio
 import texttable
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.errors import Forbidden
 import discord.utils
 from aiosqlite import IntegrityError
@@ -15,77 +14,133 @@ from helpers.paginator import Paginator
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of expired licenses handled at once, so we don't hit Discord rate limits
+_EXPIRED_LICENSE_CONCURRENCY = 10
+# Expired licenses that failed to be removed are retried after this many seconds
+_LICENSE_CHECK_RETRY_SECONDS = 60
+# Licenses are checked at least this often even if no license is about to expire
+_LICENSE_CHECK_MAX_SLEEP_SECONDS = 3600
+
 
 class LicenseHandler(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.license_check.start()
+        self._license_check_task = self.bot.loop.create_task(self.license_check())
+
+    def cog_unload(self):
+        self._license_check_task.cancel()
 
-    @tasks.loop(seconds=60.0)
     async def license_check(self):
-        try:
-            await self.check_all_active_licenses()
-        except Exception as e:
-            logger.critical(e)
+        """
+        Removes expired licenses.
+        Instead of polling the database it sleeps until the closest license expiration date, or
+        until a new licensed member is added (as that license can expire sooner) and then checks again.
 
-    @license_check.before_loop
-    async def before_printer(self):
+        """
         logger.info("Starting license check loop..")
         await self.bot.wait_until_ready()
         logger.info("License check loop started!")
+        licensed_member_added = self.bot.main_db.licensed_member_added
+        while True:
+            # Cleared before the check so members added during the check are not missed
+            licensed_member_added.clear()
+            try:
+                # Same time for both queries so a license expiring in between is not skipped by both
+                current_time = get_current_time()
+                expired_left = await self.check_all_active_licenses(current_time)
+                next_expiration_date = await self.bot.main_db.get_next_license_expiration_date(current_time)
+                sleep_seconds = self._seconds_until_next_check(next_expiration_date, expired_left)
+            except Exception as e:
+                logger.exception(f"License check failed\n{type(e).__name__}: {e}")
+                sleep_seconds = _LICENSE_CHECK_RETRY_SECONDS
 
-    async def check_all_active_licenses(self):
-        """
-        Checks all active member licenses in database and if license is expired then remove
-        the role from member and send some message.
-
-        TODO: Move query to database handler
-
-        """
-        async with self.bot.main_db.connection.execute("SELECT * FROM LICENSED_MEMBERS") as cursor:
-            async for row in cursor:
-                member_id = int(row[0])
-                member_guild_id = int(row[1])
-                expiration_date = parser.parse(row[2])
-                licensed_role_id = int(row[3])
-                if await LicenseHandler.has_license_expired(expiration_date):
-                    logger.info(f"Expired license for member:{member_id} role:{licensed_role_id} guild:{member_guild_id}")
-                    try:
-                        await self.remove_role(member_id, member_guild_id, licensed_role_id)
-                    except RoleNotFound as e1:
-                        logger.warning(e1)
-                        logger.warning(f"Role expired but can't be removed from member because he doesn't have it! "
-                                       f"Someone must have manually removed it before it expired.\t"
-                                       f"Member ID:{member_id}, guild ID:{member_guild_id}, role ID:{licensed_role_id}"
-                                       f"Continuing to db entry removal...")
-                    except GuildNotFound as e2:
-                        # If guild is not found log it and continue to guild database deletion
-                        logger.warning(e2)
-                        logger.warning(f"Guild {member_guild_id} saved in database but not found in bot guilds!"
-                                       "Removing all entries of it from database!")
-                        await self.bot.main_db.remove_all_guild_data(member_guild_id, guild_table_too=True)
-                        logger.info(f"Successfully deleted all database data for guild {member_guild_id}")
-                        continue
-                    except Exception as e3:
-                        logger.warning(f"Can't remove role {licensed_role_id } from member {member_id } guild {member_guild_id }, ignoring error: {e3}")
-                        continue
-                    await self.bot.main_db.delete_licensed_member(member_id, licensed_role_id)
-                    logger.info(f"Role {licensed_role_id} successfully removed from member:{member_id}")
+            try:
+                await asyncio.wait_for(licensed_member_added.wait(), timeout=sleep_seconds)
+            except asyncio.TimeoutError:
+                pass
 
     @staticmethod
-    async def has_license_expired(expiration_date: datetime) -> bool:
+    def _seconds_until_next_check(next_expiration_date, expired_left: bool) -> float:
         """
-        Check if param expiration date is in past related to the current date.
-        If it is in past then license is considered expired.
-        :param expiration_date: datetime object
-        :return: True if license is expired, False otherwise
+        :param next_expiration_date: datetime of the closest license expiration that is not yet expired
+                                     or None if there are no such licenses
+        :param expired_left: whether some expired licenses failed to be removed and should be retried
+        :return: float seconds to wait before next license check
 
         """
-        if expiration_date < get_current_time():
-            # Expired
-            return True
+        if next_expiration_date is None:
+            seconds = _LICENSE_CHECK_MAX_SLEEP_SECONDS
         else:
+            # Time has passed since the query so this can already be negative
+            seconds = max((next_expiration_date - get_current_time()).total_seconds(), 0)
+            seconds = min(seconds, _LICENSE_CHECK_MAX_SLEEP_SECONDS)
+
+        if expired_left:
+            return min(seconds, _LICENSE_CHECK_RETRY_SECONDS)
+        return seconds
+
+    async def check_all_active_licenses(self, current_time) -> bool:
+        """
+        Gets all expired member licenses from database, removes the licensed role from
+        each of those members and sends them a notification.
+        Expired licenses are handled concurrently, at most _EXPIRED_LICENSE_CONCURRENCY at once.
+        Failure to handle one license is logged and doesn't stop the others.
+        :param current_time: licenses with expiration date before this are expired
+        :return: bool whether some expired licenses failed to be removed from database
+
+        """
+        expired_licenses = await self.bot.main_db.get_expired_licensed_members(current_time)
+        if not expired_licenses:
+            return False
+
+        semaphore = asyncio.Semaphore(_EXPIRED_LICENSE_CONCURRENCY)
+
+        async def handle_with_limit(member_id, member_guild_id, licensed_role_id):
+            async with semaphore:
+                return await self.handle_expired_license(member_id, member_guild_id, licensed_role_id)
+
+        results = await asyncio.gather(*(handle_with_limit(*expired) for expired in expired_licenses),
+                                       return_exceptions=True)
+        expired_left = False
+        for expired, result in zip(expired_licenses, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Can't handle expired license (member, guild, role) {expired}", exc_info=result)
+            if result is not True:
+                expired_left = True
+        return expired_left
+
+    async def handle_expired_license(self, member_id: int, member_guild_id: int, licensed_role_id: int) -> bool:
+        """
+        Removes the licensed role from member and deletes the license from database.
+        :param member_id: member whose license has expired
+        :param member_guild_id: guild the license is from
+        :param licensed_role_id: role to remove from member
+        :return: bool whether the license was removed from database, False if it's left to be retried
+
+        """
+        logger.info(f"Expired license for member:{member_id} role:{licensed_role_id} guild:{member_guild_id}")
+        try:
+            await self.remove_role(member_id, member_guild_id, licensed_role_id)
+        except RoleNotFound as e1:
+            logger.warning(e1)
+            logger.warning(f"Role expired but can't be removed from member because he doesn't have it! "
+                           f"Someone must have manually removed it before it expired.\t"
+                           f"Member ID:{member_id}, guild ID:{member_guild_id}, role ID:{licensed_role_id}"
+                           f"Continuing to db entry removal...")
+        except GuildNotFound as e2:
+            # If guild is not found log it and continue to guild database deletion
+            logger.warning(e2)
+            logger.warning(f"Guild {member_guild_id} saved in database but not found in bot guilds!"
+                           "Removing all entries of it from database!")
+            await self.bot.main_db.remove_all_guild_data(member_guild_id, guild_table_too=True)
+            logger.info(f"Successfully deleted all database data for guild {member_guild_id}")
+            return True
+        except Exception as e3:
+            logger.warning(f"Can't remove role {licensed_role_id } from member {member_id } guild {member_guild_id }, ignoring error: {e3}")
             return False
+        await self.bot.main_db.delete_licensed_member(member_id, licensed_role_id)
+        logger.info(f"Role {licensed_role_id} successfully removed from member:{member_id}")
+        return True
 
     async def remove_role(self, member_id, guild_id, licensed_role_id):
         """
@@ -119,19 +174,24 @@ class LicenseHandler(commands.Cog):
                                f"Role not found ")
         else:
             await member.remove_roles(member_role)
+            # Awaited here so the DMs are limited by the same semaphore as the rest of expired license handling,
+            # a failed DM is only logged so it doesn't stop the license from being removed from database
             try:
                 expired = f"Your license in guild **{guild}** has expired for the following role: **{member_role}** "
                 await member.send(embed=simple_embed(expired, "Notification", discord.Colour.blue()))
             except Forbidden:
                 # Ignore if user has blocked DM
                 pass
+            except Exception as e:
+                logger.warning(f"Can't send license expiration notification to member {member_id}: {e}")
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
         logger.info(f"Guild {guild.name} {guild.id} joined.")
         guild_id = guild.id
-        default_prefix = self.bot.config["default_prefix"]
+        default_prefix = self.bot.default_prefix
         await self.bot.main_db.setup_new_guild(guild_id, default_prefix)
+        self.bot.prefix_cache[guild_id] = default_prefix
         logger.info(f"Guild {guild.name} {guild.id} database data added.")
 
     @commands.Cog.listener()
@@ -139,6 +199,7 @@ class LicenseHandler(commands.Cog):
         guild_id = guild.id
         logger.info(f"Guild '{guild.name}'' {guild.id} was removed. Removing all database entries.")
         await self.bot.main_db.remove_all_guild_data(guild_id, guild_table_too=True)
+        self.bot.prefix_cache.pop(guild_id, None)
         logger.info(f"Guild '{guild.name}'' {guild.id} all database entries successfully removed.")
 
     @commands.Cog.listener()
@@ -191,14 +252,15 @@ class LicenseHandler(commands.Cog):
         Removes both the database entry and the role from a member.
         """
 
-        member_data = await self.bot.main_db.get_member_data(ctx.guild.id, member.id)
+        guild = ctx.guild
+        member_data = await self.bot.main_db.get_member_data(guild.id, member.id)
         count = 0
 
         for tple in member_data:
             role_id = int(tple[0])
-            role = ctx.guild.get_role(role_id)
+            role = guild.get_role(role_id)
             if role is None:
-                logger.info(f"'revoke_all' called in guild {ctx.guild} and role that's loaded from database with "
+                logger.info(f"'revoke_all' called in guild {guild} and role that's loaded from database with "
                             f"ID:{role_id} cannot be removed from {member} because it doesn't exist in guild anymore! "
                             f"Continuing to removal from database.")
                 await self.bot.main_db.delete_licensed_member(member.id, role_id)
@@ -220,7 +282,7 @@ class LicenseHandler(commands.Cog):
         if count:
             msg = f"Successfully revoked {count} subscriptions from {member.mention}!"
             await ctx.send(embed=success(msg, ctx.me))
-            logger.info(f"{ctx.author} has revoked all subscription for member {member} in guild {ctx.guild}")
+            logger.info(f"{ctx.author} has revoked all subscription for member {member} in guild {guild}")
         else:
             msg = f"Couldn't revoke even a single subscription from member {member.mention}!"
             await ctx.send(embed=warning(msg))
@@ -533,7 +595,8 @@ class LicenseHandler(commands.Cog):
         if number > maximum_number:
             await ctx.send(embed=failure(f"Number can't be larger than {maximum_number}!"))
             return
-        to_show = await self.bot.main_db.get_random_licenses(ctx.guild.id, number)
+        guild = ctx.guild
+        to_show = await self.bot.main_db.get_random_licenses(guild.id, number)
         if not to_show:
             await ctx.send(embed=failure("No licenses saved in db."))
             return
@@ -547,13 +610,13 @@ class LicenseHandler(commands.Cog):
         for entry in to_show:
             # Entry is in form ('I0QSZeyPJTy3H8tNsmUihKsn8JH48y', '617484493296631839', 720)
             try:
-                role = ctx.guild.get_role(int(entry[1]))
+                role = guild.get_role(int(entry[1]))
                 table.add_row((entry[0], role.name, entry[2]))
             except (ValueError, AttributeError):
                 # Just in case if error in case role is None (deleted from guild) just show IDs from database
                 table.add_row(entry)
 
-        title = f"Showing {number} random licenses from guild '{ctx.guild.name}':\n\n"
+        title = f"Showing {number} random licenses from guild '{guild.name}':\n\n"
         await ctx.send(embed=success("Sent to DM!", ctx.me), delete_after=5)
         await Paginator.paginate(self.bot, ctx.author, ctx.author, table.draw(), title=title)
 
@@ -583,7 +646,8 @@ class LicenseHandler(commands.Cog):
         header = ("Licensed role", "Expiration date")
         table.add_row(header)
 
-        all_active = await self.bot.main_db.get_member_data(ctx.guild.id, member.id)
+        guild = ctx.guild
+        all_active = await self.bot.main_db.get_member_data(guild.id, member.id)
         if not all_active:
             await ctx.send(embed=failure(f"Nothing to show for {member.mention}."))
             return
@@ -591,7 +655,7 @@ class LicenseHandler(commands.Cog):
         for entry in all_active:
             # Entry is in form ("license_id", "expiration_date)
             try:
-                role = ctx.guild.get_role(int(entry[0]))
+                role = guild.get_role(int(entry[0]))
                 table.add_row((role.name, entry[1]))
             except (ValueError, AttributeError):
                 # Just in case if error in case role is None (deleted from guild) just show IDs from database
@@ -599,7 +663,7 @@ class LicenseHandler(commands.Cog):
 
         local_time = get_current_time()
         title = (f"Server local time: {local_time}\n\n"
-                 f"{member.name} active subscriptions in guild '{ctx.guild.name}':\n\n")
+                 f"{member.name} active subscriptions in guild '{guild.name}':\n\n")
 
         await ctx.send(embed=info("Sent in Dms!", ctx.me), delete_after=5)
         await Paginator.paginate(self.bot, ctx.author, ctx.author, table.draw(), title=title, prefix="```DNS\n")
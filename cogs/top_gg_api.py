@@ -1,5 +1,4 @@
 import logging
-import dbl
 from discord.ext import commands, tasks
 
 logger = logging.getLogger(__name__)
@@ -9,6 +8,8 @@ class TopGGApi(commands.Cog):
     """Handles interactions with the top.gg API"""
 
     def __init__(self, bot):
+        # Imported here so dbl is only loaded if the cog is actually used (see setup)
+        import dbl
         self.bot = bot
         self.dbl_client = dbl.DBLClient(self.bot, self.bot.config["top_gg_api_key"])
         self.update_stats_loop.start()
@@ -30,4 +31,8 @@ class TopGGApi(commands.Cog):
 
 
 def setup(bot):
+    # Without api key there is nothing to post to, skip the cog (and importing dbl)
+    if not bot.config["top_gg_api_key"]:
+        logger.info("top.gg api key not set, top.gg cog is not loaded.")
+        return
     bot.add_cog(TopGGApi(bot))
@@ -1,14 +1,21 @@
 import logging
+import asyncio
 import aiosqlite
-from typing import Tuple, List
+from typing import Tuple, List, Dict, FrozenSet, Iterable, Optional
 from pathlib import Path
 from datetime import datetime
+from dateutil import parser
 from helpers import misc
 from helpers import licence_helper
 from helpers.errors import DefaultGuildRoleNotSet, DatabaseMissingData
+from helpers.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+_GUILD_INFO_CACHE_SIZE = 10_000
+# Number of rows fetched at once when iterating over big results
+_FETCH_CHUNK_SIZE = 500
+
 
 class DatabaseHandler:
     DB_PATH = "databases/"
@@ -31,6 +38,12 @@ class DatabaseHandler:
     def __init__(self):
         self.db_name = None
         self.connection = None
+        # Guild settings rarely change so they are cached (see _get_guild_settings),
+        # every method that changes GUILDS table has to invalidate the guild entry.
+        self._guild_info_cache = LRUCache(maxsize=_GUILD_INFO_CACHE_SIZE)
+        # Set when new licensed member is added, the license check waits on it since
+        # the new license could expire before the one it's currently waiting for.
+        self.licensed_member_added = asyncio.Event()
 
     async def _get_connection(self) -> aiosqlite.core.Connection:
         """
@@ -40,11 +53,17 @@ class DatabaseHandler:
         path = DatabaseHandler._construct_path(self.db_name)
         if Path(path).is_file():
             conn = await aiosqlite.connect(path)
-            return conn
         else:
             logger.warning("Database not found! Creating fresh ...")
             misc.check_create_directory(DatabaseHandler.DB_PATH)
-            return await DatabaseHandler._create_database(path)
+            conn = await DatabaseHandler._create_database(path)
+        # WAL journal is persistent but setting it again is a no-op. Since almost every write is committed
+        # separately, synchronous=NORMAL saves a fsync per commit, in WAL mode it's still safe from corruption.
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        # Also done for existing databases so ones created before indexes were added get them too
+        await DatabaseHandler._create_indexes(conn)
+        return conn
 
     @staticmethod
     def _construct_path(db_name: str) -> str:
@@ -91,6 +110,23 @@ class DatabaseHandler:
         logger.info("Database successfully created!")
         return conn
 
+    @staticmethod
+    async def _create_indexes(conn: aiosqlite.core.Connection):
+        """
+        Creates indexes for columns that are often filtered on, if they don't already exist.
+        :param conn: connection to the database to create indexes in
+        """
+        # Expired license check and next expiration date
+        await conn.execute("CREATE INDEX IF NOT EXISTS IDX_LICENSED_MEMBERS_EXPIRATION_DATE "
+                           "ON LICENSED_MEMBERS(EXPIRATION_DATE)")
+        # Member data, guild active license count and guild data removal
+        await conn.execute("CREATE INDEX IF NOT EXISTS IDX_LICENSED_MEMBERS_GUILD_MEMBER "
+                           "ON LICENSED_MEMBERS(GUILD_ID, MEMBER_ID)")
+        # Guild licenses for role, guild stored license count and guild data removal
+        await conn.execute("CREATE INDEX IF NOT EXISTS IDX_GUILD_LICENSES_GUILD_ROLE "
+                           "ON GUILD_LICENSES(GUILD_ID, LICENSED_ROLE_ID)")
+        await conn.commit()
+
     async def update_database(self, query: str, *args):
         await self.connection.execute(query, args)
         await self.connection.commit()
@@ -99,6 +135,21 @@ class DatabaseHandler:
     async def setup_new_guild(self, guild_id: int, default_prefix: str):
         insert_guild_query = "INSERT INTO GUILDS(GUILD_ID, PREFIX) VALUES(?,?)"
         await self.update_database(insert_guild_query, guild_id, default_prefix)
+        self._guild_info_cache.pop(guild_id, None)
+
+    async def setup_new_guilds(self, guild_ids: Iterable[int], default_prefix: str):
+        """
+        Same as setup_new_guild but for multiple guilds at once, all are inserted with one commit.
+        Guilds that are already in the database are skipped.
+        guild_ids can be any iterable, it is copied to a tuple since it's walked twice.
+        """
+        guild_ids = tuple(guild_ids)
+        insert_guild_query = "INSERT OR IGNORE INTO GUILDS(GUILD_ID, PREFIX) VALUES(?,?)"
+        await self.connection.executemany(insert_guild_query,
+                                          ((guild_id, default_prefix) for guild_id in guild_ids))
+        await self.connection.commit()
+        for guild_id in guild_ids:
+            self._guild_info_cache.pop(guild_id, None)
 
     async def get_guild_prefix(self, guild_id: int) -> str:
         query = "SELECT PREFIX FROM GUILDS WHERE GUILD_ID=?"
@@ -106,15 +157,33 @@ class DatabaseHandler:
             row = await cursor.fetchone()
             return row[0]
 
-    async def get_all_guild_ids(self):
+    async def get_all_guild_ids(self) -> FrozenSet[int]:
         """
-        :return: a tuple of all guild ids (ints)
+        Rows are read in chunks so the raw result is never loaded all at once.
+        :return: a frozenset of all guild ids (ints)
 
         """
         query = "SELECT GUILD_ID FROM GUILDS"
+        guild_ids = set()
+        async with self.connection.execute(query) as cursor:
+            # Not using async for since aiosqlite fetches one row per executor call that way
+            while True:
+                rows = await cursor.fetchmany(_FETCH_CHUNK_SIZE)
+                if not rows:
+                    break
+                guild_ids.update(int(row[0]) for row in rows)
+        return frozenset(guild_ids)
+
+    async def get_all_guild_prefixes(self) -> Dict[int, str]:
+        """
+        Fetches prefixes of all guilds in a single query.
+        :return: dict mapping int guild id to str prefix (empty string if prefix is not set)
+
+        """
+        query = "SELECT GUILD_ID, PREFIX FROM GUILDS"
         async with self.connection.execute(query) as cursor:
             results = await cursor.fetchall()
-            return tuple(int(guild_id[0]) for guild_id in results)
+            return {int(guild_id): prefix or "" for guild_id, prefix in results}
 
     async def change_guild_prefix(self, guild_id: int, prefix: str):
         """
@@ -124,14 +193,17 @@ class DatabaseHandler:
         """
         query = "UPDATE GUILDS SET PREFIX=? WHERE GUILD_ID=?"
         await self.update_database(query, prefix, guild_id)
+        self._guild_info_cache.pop(guild_id, None)
 
     async def change_default_guild_role(self, guild_id: int, role_id: int):
         query = "UPDATE GUILDS SET DEFAULT_LICENSE_ROLE_ID=? WHERE GUILD_ID=?"
         await self.update_database(query, role_id, guild_id)
+        self._guild_info_cache.pop(guild_id, None)
 
     async def change_default_license_expiration(self, guild_id: int, expiration_hours: int):
         query = "UPDATE GUILDS SET DEFAULT_LICENSE_DURATION_HOURS=? WHERE GUILD_ID=?"
         await self.update_database(query, expiration_hours, guild_id)
+        self._guild_info_cache.pop(guild_id, None)
 
     async def get_default_guild_license_role_id(self, guild_id: int) -> int:
         """
@@ -141,17 +213,15 @@ class DatabaseHandler:
         :raise: DefaultGuildRoleNotSet if it's None
 
         """
-        query = "SELECT DEFAULT_LICENSE_ROLE_ID FROM GUILDS WHERE GUILD_ID=?"
-        async with self.connection.execute(query, (guild_id,)) as cursor:
-            row = await cursor.fetchone()
-            try:
-                return int(row[0])
-            except TypeError:
-                raise DefaultGuildRoleNotSet("Default guild license not set!\n\n"
-                                             "For more information call command:\n"
-                                             "{prefix}help default_role\n\n"
-                                             "If still in doubt call:\n"
-                                             "{prefix}help")
+        guild_settings = await self._get_guild_settings(guild_id)
+        # Settings are None if guild is not in database, role id is None if it was never set
+        if guild_settings is None or guild_settings[1] is None:
+            raise DefaultGuildRoleNotSet("Default guild license not set!\n\n"
+                                         "For more information call command:\n"
+                                         "{prefix}help default_role\n\n"
+                                         "If still in doubt call:\n"
+                                         "{prefix}help")
+        return int(guild_settings[1])
 
     async def get_default_guild_license_duration_hours(self, guild_id: int) -> int:
         """
@@ -159,26 +229,44 @@ class DatabaseHandler:
         :return: int representing hours of license duration
 
         """
-        query = "SELECT DEFAULT_LICENSE_DURATION_HOURS FROM GUILDS WHERE GUILD_ID=?"
-        async with self.connection.execute(query, (guild_id,)) as cursor:
-            row = await cursor.fetchone()
-            #
-            if not row:
-                # License duration has default value.
-                # So if this is None it means the guild is not found in database.
-                raise DatabaseMissingData(f"Guild {guild_id} not found in database!")
-            return int(row[0])
+        guild_settings = await self._get_guild_settings(guild_id)
+        if guild_settings is None:
+            # License duration has default value.
+            # So if this is None it means the guild is not found in database.
+            raise DatabaseMissingData(f"Guild {guild_id} not found in database!")
+        return int(guild_settings[2])
 
     async def get_guild_info(self, guild_id: int) -> Tuple[str, str, int]:
         """
         :param guild_id:
         :return: tuple(str prefix, str role_id, int expiration hours)
+        :raise: DatabaseMissingData if guild is not found in database
         """
-        query = "SELECT * FROM GUILDS WHERE GUILD_ID=?"
+        guild_settings = await self._get_guild_settings(guild_id)
+        if guild_settings is None:
+            raise DatabaseMissingData(f"Guild {guild_id} not found in database!")
+        return guild_settings
+
+    async def _get_guild_settings(self, guild_id: int) -> Optional[Tuple[str, str, int]]:
+        """
+        Guild settings are read by most license commands so they are cached until changed.
+        Guilds missing from database are not cached.
+        :param guild_id:
+        :return: tuple(str prefix, str role_id, int expiration hours) or None if guild is not in database
+        """
+        if guild_id in self._guild_info_cache:
+            return self._guild_info_cache[guild_id]
+
+        query = ("SELECT PREFIX, DEFAULT_LICENSE_ROLE_ID, DEFAULT_LICENSE_DURATION_HOURS "
+                 "FROM GUILDS WHERE GUILD_ID=?")
         async with self.connection.execute(query, (guild_id,)) as cursor:
             row = await cursor.fetchone()
-            # ('guild_id', 'prefix', 0, None, 'role_id', hours)
-            return row[1], row[4], row[5]
+
+        if row is None:
+            return None
+        guild_settings = row[0], row[1], row[2]
+        self._guild_info_cache[guild_id] = guild_settings
+        return guild_settings
 
     # TABLE LICENSED_MEMBERS #############################################################
 
@@ -186,6 +274,7 @@ class DatabaseHandler:
                                       expiration_date: datetime, licensed_role_id: int):
         query = "INSERT INTO LICENSED_MEMBERS(MEMBER_ID, GUILD_ID, EXPIRATION_DATE, LICENSED_ROLE_ID) VALUES(?,?,?,?)"
         await self.update_database(query, member_id, guild_id, expiration_date, licensed_role_id)
+        self.licensed_member_added.set()
 
     async def delete_licensed_member(self, member_id: int, licensed_role_id: int):
         """
@@ -197,6 +286,31 @@ class DatabaseHandler:
         delete_query = "DELETE FROM LICENSED_MEMBERS WHERE MEMBER_ID=? AND LICENSED_ROLE_ID=?"
         await self.update_database(delete_query, member_id, licensed_role_id)
 
+    async def get_expired_licensed_members(self, current_time: datetime) -> List[Tuple[int, int, int]]:
+        """
+        Expiration dates are saved as ISO formatted strings which sort the same way as the dates
+        themselves, so expired licenses are filtered in the query instead of parsing every row.
+        :param current_time: licenses with expiration date before this are expired
+        :return: list of tuples(int member id, int guild id, int licensed role id)
+
+        """
+        query = ("SELECT MEMBER_ID, GUILD_ID, LICENSED_ROLE_ID FROM LICENSED_MEMBERS "
+                 "WHERE EXPIRATION_DATE < ?")
+        async with self.connection.execute(query, (current_time,)) as cursor:
+            results = await cursor.fetchall()
+            return [(int(member_id), int(guild_id), int(role_id)) for member_id, guild_id, role_id in results]
+
+    async def get_next_license_expiration_date(self, current_time: datetime) -> Optional[datetime]:
+        """
+        :param current_time: licenses with expiration date before this are ignored as they are already expired
+        :return: datetime of the closest expiration date of all active licenses or None if there are none
+
+        """
+        query = "SELECT MIN(EXPIRATION_DATE) FROM LICENSED_MEMBERS WHERE EXPIRATION_DATE >= ?"
+        async with self.connection.execute(query, (current_time,)) as cursor:
+            row = await cursor.fetchone()
+            return None if row[0] is None else parser.parse(row[0])
+
     async def get_member_license_expiration_date(self, member_id: int, licensed_role_id: int) -> str:
         query = "SELECT EXPIRATION_DATE FROM LICENSED_MEMBERS WHERE MEMBER_ID=? AND LICENSED_ROLE_ID=?"
         async with self.connection.execute(query, (member_id, licensed_role_id)) as cursor:
@@ -275,8 +389,9 @@ class DatabaseHandler:
         licenses = licence_helper.generate_multiple(number)
         query = """INSERT INTO GUILD_LICENSES(LICENSE, GUILD_ID, LICENSED_ROLE_ID, LICENSE_DURATION_HOURS)
                    VALUES(?,?,?,?)"""
-        for license in licenses:
-            await self.connection.execute(query, (license, guild_id, license_role_id, license_duration))
+        # One executemany instead of a query (and a thread round trip) per license
+        await self.connection.executemany(query, ((license, guild_id, license_role_id, license_duration)
+                                                  for license in licenses))
         await self.connection.commit()
         return licenses
 
@@ -321,6 +436,17 @@ class DatabaseHandler:
             result = await cursor.fetchone()
             return result[0]
 
+    async def get_license_counts(self) -> Tuple[int, int]:
+        """
+        Counts both active and stored licenses in one query.
+        :return: tuple(int active licenses count, int stored licenses count)
+
+        """
+        query = ("SELECT (SELECT COUNT(*) FROM LICENSED_MEMBERS), "
+                 "(SELECT COUNT(*) FROM GUILD_LICENSES)")
+        async with self.connection.execute(query) as cursor:
+            return await cursor.fetchone()
+
     async def is_valid_license(self, license: str, guild_id: int) -> bool:
         """
         :param license: License to check
@@ -358,6 +484,7 @@ class DatabaseHandler:
             await self.connection.execute(query, (guild_id,))
 
         await self.connection.commit()
+        self._guild_info_cache.pop(guild_id, None)
 
     async def remove_all_guild_role_data(self, role_id: int):
         queries = ["DELETE FROM LICENSED_MEMBERS WHERE LICENSED_ROLE_ID=?",
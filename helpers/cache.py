@@ -0,0 +1,26 @@
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    """
+    Dictionary limited to maxsize items.
+    Once full the least recently used item is dropped when adding new one.
+    Both getting (with brackets) and setting an item counts as usage, 'in' checks do not.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            oldest = next(iter(self))
+            del self[oldest]
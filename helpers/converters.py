@@ -10,6 +10,14 @@ discord py commands.
 
 """
 
+# Compiled once at import instead of on each conversion
+_TIME_STRING_PATTERN = re.compile("""(?:(?P<years>[0-9])(?:years?|y))?          # e.g. 2years or 2y
+                                     (?:(?P<months>[0-9]{1,2})(?:months?|m))?   # e.g. 2months or 2m
+                                     (?:(?P<weeks>[0-9]{1,4})(?:weeks?|w))?     # e.g. 10weeks or 10w
+                                     (?:(?P<days>[0-9]{1,5})(?:days?|d))?       # e.g. 14days or 10d
+                                     (?:(?P<hours>[0-9]{1,5})(?:hours?|h))?     # e.g. 12hours or 12h
+                                  """, re.VERBOSE)
+
 
 def positive_integer(integer):
     """
@@ -42,15 +50,9 @@ def time_string_to_hours(str_input: str) -> int:
                             1w              /   168
 
     """
-    compiled = re.compile("""(?:(?P<years>[0-9])(?:years?|y))?          # e.g. 2years or 2y
-                             (?:(?P<months>[0-9]{1,2})(?:months?|m))?   # e.g. 2months or 2m
-                             (?:(?P<weeks>[0-9]{1,4})(?:weeks?|w))?     # e.g. 10weeks or 10w
-                             (?:(?P<days>[0-9]{1,5})(?:days?|d))?       # e.g. 14days or 10d
-                             (?:(?P<hours>[0-9]{1,5})(?:hours?|h))?     # e.g. 12hours or 12h
-                          """, re.VERBOSE)
     hours = 0
     for word in str_input.split():
-        match = compiled.fullmatch(word)
+        match = _TIME_STRING_PATTERN.fullmatch(word)
         if match is None or not match.group(0):
             raise commands.BadArgument("Invalid time provided.")
 
@@ -2,16 +2,17 @@ import random
 import string
 from datetime import datetime, timedelta
 
+# Characters licenses are made of, built once instead of concatenating for each license
+_LICENSE_CHARACTERS = string.ascii_letters + string.digits
+_LICENSE_LENGTH = 30
+
 
 def generate_multiple(amount: int) -> list:
-    licenses = []
-    for i in range(amount):
-        licenses.append(generate_single())
-    return licenses
+    return [generate_single() for _ in range(amount)]
 
 
 def generate_single() -> str:
-    return "".join(random.choices(string.ascii_letters + string.digits, k=30))
+    return "".join(random.choices(_LICENSE_CHARACTERS, k=_LICENSE_LENGTH))
 
 
 def construct_expiration_date(license_duration_hours: int) -> datetime:
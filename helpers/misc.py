@@ -1,8 +1,10 @@
 import os
 import logging
+import traceback
 from pathlib import Path
 from discord import Embed, Colour
 import timeago as timesince
+from helpers.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -17,18 +19,12 @@ def construct_load_bar_string(percent, message=None, size=None):
     limiters = "|"
     element_emtpy = "▱"
     element_full = "▰"
-    constructed = ""
 
     if percent > 100:
         percent = 100
-    progress = int(round(percent / size))
-
-    constructed += limiters
-    for x in range(0, progress):
-        constructed += element_full
-    for x in range(progress, size):
-        constructed += element_emtpy
-    constructed += limiters
+    progress = min(int(round(percent / size)), size)
+
+    constructed = f"{limiters}{element_full * progress}{element_emtpy * (size - progress)}{limiters}"
     if message is None:
         constructed = f"{constructed} {percent:.2f}%"
     else:
@@ -77,6 +73,42 @@ def check_create_directory(directory_path: str):
         os.mkdir(directory_path)
 
 
+_traceback_cache = LRUCache(maxsize=256)
+
+
+def _exception_signature(error: BaseException) -> tuple:
+    """
+    Builds a hashable signature of exception (and exceptions chained to it) from
+    exception type, message and (filename, first line, line) of each traceback frame.
+    Walking the frames is a lot cheaper than formatting them.
+    """
+    signature = []
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        frames = []
+        tb = error.__traceback__
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            frames.append((code.co_filename, code.co_firstlineno, tb.tb_lineno))
+            tb = tb.tb_next
+        signature.append((type(error), str(error), tuple(frames)))
+        error = error.__cause__ or error.__context__
+    return tuple(signature)
+
+
+def format_traceback(error: BaseException) -> str:
+    """
+    Returns formatted traceback of passed exception as a string.
+    Same errors tend to repeat a lot (example one guild spamming broken command) so formatted
+    tracebacks are cached, with the least recently used one dropped once cache is full.
+    """
+    key = _exception_signature(error)
+    if key not in _traceback_cache:
+        _traceback_cache[key] = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    return _traceback_cache[key]
+
+
 def maximize_size(message: str):
     return (message[:1980] + "...too long") if len(message) > 1980 else message
 
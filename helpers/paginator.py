@@ -69,13 +69,18 @@ class Paginator:
         chunk_list = string.split(separator)
         Paginator.break_long_entries(chunk_list, max_msg_size)
         temp_chunk = []
+        # Combined length of strings in temp_chunk, kept as running total so it's not summed again for each entry
+        temp_chunk_length = 0
         for entry in chunk_list:
+            entry_length = len(entry)
             # len(temp_chunk) is because we'll add separators in join
-            if sum(map(len, temp_chunk)) + len(entry) + len(temp_chunk) >= max_msg_size:
+            if temp_chunk_length + entry_length + len(temp_chunk) >= max_msg_size:
                 constructed_chunks.append(title + separator.join(temp_chunk))
                 temp_chunk = [entry]
+                temp_chunk_length = entry_length
             else:
                 temp_chunk.append(entry)
+                temp_chunk_length += entry_length
 
         # For leftovers
         constructed_chunks.append(title + separator.join(temp_chunk))